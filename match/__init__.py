@@ -1,5 +1,7 @@
 from .hungarian import solve as solve_hungarian
+from .hungarian import solve_sweep as solve_hungarian_sweep
 
 __all__ = [
     'solve_hungarian',
+    'solve_hungarian_sweep',
 ]
@@ -0,0 +1,46 @@
+"""Ahead of time compile the scoring kernels into match/_score_kernels, so runs don't pay for the numba JIT
+
+Run with `python -m match.build_kernels`. score.py uses the compiled module when it has been built and falls back to
+the JIT kernels in score_numba otherwise. numba.pycc is deprecated upstream, so this may stop working on a future numba
+"""
+import os
+
+import numpy as np
+from numba.pycc import CC
+
+cc = CC('_score_kernels')
+cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+@cc.export('score_frac_boost', 'f8[:](i8[:], i4[:, :], f8)')
+def score_frac_boost(matches: np.ndarray, prefs: np.ndarray, b: float) -> np.ndarray:
+    """Score integer encoded matches with frac, the identity warp and a boost of b
+
+    Serial version of score_numba._score_frac_boost, as AOT compiled code can't run in parallel
+
+    Args:
+        matches: id of the match of each person
+        prefs: prefs[x, k] is the k-th choice of person x, padded with -1
+        b: boost level
+
+    Returns:
+        np.ndarray: scores of each individual
+    """
+    N, L = prefs.shape
+    out = np.zeros(N)
+    for x in range(N):
+        # Length of the real part of the row
+        n = 0
+        while n < L and prefs[x, n] >= 0:
+            n += 1
+
+        m = matches[x]
+        for i in range(n):
+            if prefs[x, i] == m:
+                out[x] = (n - i) / n + b
+                break
+    return out
+
+
+if __name__ == '__main__':
+    cc.compile()
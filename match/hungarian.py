@@ -1,9 +1,55 @@
-from typing import List, Dict, Tuple
+import math
+from typing import List, Dict, Optional, Tuple
 
 import numpy as np
 from scipy.optimize import linear_sum_assignment
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import min_weight_full_bipartite_matching
 
-from .score import score_exponential
+from .score import build_rank_tables, score_exponential, score_exponential_matrix
+
+try:
+    import lap
+except ImportError:
+    lap = None
+
+# Score matrices with fewer non-zero entries than this are solved as a sparse assignment problem
+SPARSE_DENSITY = 0.3
+# Dense problems larger than this are handed to lap.lapjv when it is installed
+LAPJV_MIN_SIZE = 256
+
+
+def _build_rank_matrix(
+        agents: List[str],
+        tasks: List[str],
+        prefs: Dict[str, List[str]],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Build a matrix of the rank each agent gives each task
+
+    Args:
+        agents: list of agents
+        tasks: list of tasks
+        prefs: dictionary of preference lists, keyed by agent
+
+    Returns:
+        (np.ndarray, np.ndarray): rank matrix (len(tasks) where a task is unranked) and preference list lengths
+    """
+    n = len(tasks)
+    task_idx = {t: j for j, t in enumerate(tasks)}
+
+    rank = np.empty((len(agents), n), dtype=np.int32)
+    rank.fill(n)
+    lengths = np.empty(len(agents), dtype=np.int32)
+    for i, agent in enumerate(agents):
+        # A repeated task only counts where it first appears
+        agent_prefs = list(dict.fromkeys(prefs[agent]))
+        # Tasks that aren't in the problem are encoded as -1 and skipped
+        ids = np.fromiter((task_idx.get(t, -1) for t in agent_prefs), dtype=np.int32, count=len(agent_prefs))
+        known = ids >= 0
+        rank[i, ids[known]] = np.arange(len(ids), dtype=np.int32)[known]
+        lengths[i] = len(agent_prefs)
+
+    return rank, lengths
 
 
 def _build_score_matrix(
@@ -11,6 +57,7 @@ def _build_score_matrix(
         tasks: List[str],
         prefs: Dict[str, List[str]],
         score_fn=score_exponential,
+        out: Optional[np.ndarray] = None,
 ) -> np.ndarray:
     """Build a cost matrix of assigning agents to tasks based on preferences
 
@@ -19,6 +66,7 @@ def _build_score_matrix(
         tasks: list of tasks
         prefs: dictionary of preference lists, keyed by agent
         score_fn: scoring function
+        out: optional float32 buffer of shape (n, n) to build the matrix in
 
     Returns:
         np.ndarray: score matrix
@@ -26,28 +74,119 @@ def _build_score_matrix(
     assert(len(agents) == len(tasks))
 
     n = len(agents)
-    cost_matrix = np.zeros((n, n))
 
-    for agent in agents:
-        agent_prefs = prefs[agent]
-        for task in tasks:
-            i = agents.index(agent)
-            j = tasks.index(task)
-            cost_matrix[i, j] = score_fn(task, agent_prefs)
+    if score_fn is score_exponential:
+        rank, lengths = _build_rank_matrix(agents, tasks, prefs)
+        lengths = lengths[:, None]
+        frac_mat = np.subtract(lengths, rank, out=out, dtype=np.float32)
+        frac_mat /= np.maximum(lengths, 1)
+        frac_mat[rank >= n] = 0.0
+        return score_exponential_matrix(frac_mat, out=frac_mat)
+
+    ranks, lengths = build_rank_tables(prefs)
+    cost_matrix = np.empty((n, n), dtype=np.float32) if out is None else out
+    for i, agent in enumerate(agents):
+        agent_ranks = ranks[agent]
+        agent_n = lengths[agent]
+        for j, task in enumerate(tasks):
+            cost_matrix[i, j] = score_fn(task, agent_ranks, agent_n)
 
     return cost_matrix
 
 
-def _score_to_cost_matrix(score_matrix: np.ndarray) -> np.ndarray:
+def _score_to_cost_matrix(score_matrix: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
     """Converts score matrix to cost matrix
 
     Args:
         score_matrix: score matrix
+        out: optional buffer to write the cost matrix to, which may be score_matrix itself
 
     Returns:
         np.ndarray: cost matrix
     """
-    return np.max(score_matrix) - score_matrix
+    return np.subtract(np.max(score_matrix), score_matrix, out=out)
+
+
+def _solve_sparse(score_matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Find the assignment maximizing the total score using only the non-zero entries of the score matrix
+
+    Any partial matching over the non-zero entries can be completed with zero score entries, so it is enough to find
+    the best partial matching. Row i is given a dummy column n + i and column j a dummy row n + j, and dummy row n + j
+    can reach dummy column n + i for every real edge (i, j), so the padded graph always has a full matching. Real
+    edges cost C - score and dummy edges cost C, which makes every full matching cost 2nC minus its real score.
+
+    Args:
+        score_matrix: square score matrix
+
+    Returns:
+        (np.ndarray, np.ndarray): row indices and their assigned column indices
+    """
+    n = score_matrix.shape[0]
+    rows, cols = np.nonzero(score_matrix > 0)
+    c = score_matrix.max() + 1
+    diag = np.arange(n)
+
+    padded_rows = np.concatenate([rows, diag, n + diag, n + cols])
+    padded_cols = np.concatenate([cols, n + diag, diag, n + rows])
+    weights = np.concatenate([c - score_matrix[rows, cols], np.full(2 * n + len(rows), c)])
+    graph = csr_matrix((weights, (padded_rows, padded_cols)), shape=(2 * n, 2 * n))
+
+    row_ind, col_ind = min_weight_full_bipartite_matching(graph)
+
+    # Keep the real edges and pair up everyone left over arbitrarily
+    real = (row_ind < n) & (col_ind < n)
+    assignment = np.full(n, -1)
+    assignment[row_ind[real]] = col_ind[real]
+    unmatched_rows = np.flatnonzero(assignment == -1)
+    unmatched_cols = np.setdiff1d(diag, col_ind[real])
+    assignment[unmatched_rows] = unmatched_cols
+
+    return diag, assignment
+
+
+def _assign(score_matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Find the assignment maximizing the total score
+
+    Args:
+        score_matrix: square score matrix
+
+    Returns:
+        (np.ndarray, np.ndarray): row indices and their assigned column indices
+    """
+    n = score_matrix.shape[0]
+
+    if np.count_nonzero(score_matrix) < SPARSE_DENSITY * score_matrix.size:
+        return _solve_sparse(score_matrix)
+
+    if lap is not None and n > LAPJV_MIN_SIZE:
+        # Convert score matrix into cost matrix (minimize cost -> maximize score) in place, then convert it back
+        max_score = np.max(score_matrix)
+        cost_matrix = _score_to_cost_matrix(score_matrix, out=score_matrix)
+        _, row2col, _ = lap.lapjv(cost_matrix)
+        np.subtract(max_score, cost_matrix, out=score_matrix)
+        return np.arange(n), row2col
+
+    return linear_sum_assignment(score_matrix, maximize=True)
+
+
+def _solve_assignment(score_matrix: np.ndarray, women: List[str], men: List[str]) -> Tuple[Dict[str, str], float]:
+    """Solve the assignment problem on a combined score matrix and decode the matches
+
+    Args:
+        score_matrix: score matrix, rows are women and columns are men
+        women: list of women
+        men: list of men
+
+    Returns:
+        (dict, float): matches keyed by women and the total score
+    """
+    row_ind, col_ind = _assign(score_matrix)
+
+    # Gather the matched scores in one go and total them with fsum, which is exact however many there are
+    score = math.fsum(score_matrix[row_ind, col_ind])
+    matches = {women[r]: men[c] for r, c in zip(row_ind.tolist(), col_ind.tolist())}
+
+    return matches, score
 
 
 def solve(
@@ -71,18 +210,40 @@ def solve(
     # Have to take the transpose to make sure the proper entries line up
     m_score_matrix = _build_score_matrix(men, women, m_prefs, score_fn=score_fn).T
 
-    score_matrix = weight * w_score_matrix + (1 - weight) * m_score_matrix
+    # Both matrices are freshly built, so weight and combine them in place
+    w_score_matrix *= weight
+    m_score_matrix *= 1 - weight
+    score_matrix = np.add(w_score_matrix, m_score_matrix, out=w_score_matrix)
+
+    return _solve_assignment(score_matrix, women, men)
+
 
-    # Convert score matrix into cost matrix (minimize cost -> maximize score)
-    cost_matrix = _score_to_cost_matrix(score_matrix)
+def solve_sweep(
+        w_prefs: Dict[str, List[str]],
+        m_prefs: Dict[str, List[str]],
+        weights: List[float],
+        score_fn=score_exponential,
+) -> List[Tuple[Dict[str, str], float]]:
+    """Solve the matching problem for several weights, building the score matrices only once
 
-    row_ind, col_ind = linear_sum_assignment(cost_matrix)
+    Args:
+        w_prefs: preference lists of the women
+        m_prefs: preference lists of th men
+        weights: floats in the range [0.0, 1.0] that show how much weight to assign to the women's preferences
+        score_fn: scoring function
 
-    # Build matches dict
-    score = 0.0
-    matches = {}
-    for r, c in zip(row_ind, col_ind):
-        score += score_matrix[r][c]
-        matches[women[r]] = men[c]
+    Returns:
+        list: matches and score for each weight, as returned by solve
+    """
+    women = list(w_prefs.keys())
+    men = list(m_prefs.keys())
 
-    return matches, score
+    w_score_matrix = _build_score_matrix(women, men, w_prefs, score_fn=score_fn)
+    # Have to take the transpose to make sure the proper entries line up
+    m_score_matrix = _build_score_matrix(men, women, m_prefs, score_fn=score_fn).T
+
+    # One (k, n, n) stack of combined score matrices, one per weight
+    w = np.asarray(weights, dtype=np.float32)[:, None, None]
+    score_matrices = w * w_score_matrix + (1 - w) * m_score_matrix
+
+    return [_solve_assignment(score_matrix, women, men) for score_matrix in score_matrices]
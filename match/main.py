@@ -1,15 +1,26 @@
 import argparse
 import datetime
+import functools
+import os
 import pickle
 import sys
-from typing import Dict, List, Set
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
 
+import numpy as np
 from tqdm import tqdm
 
+try:
+    import numba
+except ImportError:
+    numba = None
+
 from . import smp
+from .prefs import Encoder, Prefs
 from .hungarian import solve as solve_hungarian
-from .score import score_assignment, score_exponential, one_zero, frac, identity, exponential
-from .utils import complete
+from .score import score_vec, score_exponential, one_zero, frac, identity, exponential
+from .utils import complete_ids, encode_blacklist
 
 scorers = {
     'one_zero': one_zero,
@@ -40,6 +51,8 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument('--scorer', default='one_zero', choices=scorers)
     parser.add_argument('--warper', default='identity', choices=warpers)
     parser.add_argument('--boost', default=0.0, type=float)
+    parser.add_argument('--seed', default=None, type=int, help='seed for the random completions')
+    parser.add_argument('-j', '--workers', default=os.cpu_count(), type=int, help='number of worker processes')
 
     return parser.parse_args()
 
@@ -53,14 +66,12 @@ def read_prefs(f_path: str) -> Dict[str, List[str]]:
     Returns:
         dict: preference lists keyed by person name
     """
-    prefs = {}
     with open(f_path, 'r') as f:
-        line = f.readline()
-        while line:
-            person, prefs_csv = line.split(':')
-            prefs[person] = prefs_csv.strip().split(',')
-            line = f.readline()
-    return prefs
+        lines = f.read().splitlines()
+    return dict(
+        (person, prefs_csv.strip().split(','))
+        for person, prefs_csv in (line.split(':', 1) for line in lines)
+    )
 
 
 def read_blacklist(f_path: str) -> Dict[str, Set[str]]:
@@ -75,16 +86,89 @@ def read_blacklist(f_path: str) -> Dict[str, Set[str]]:
     if not f_path:
         return {}
 
-    blacklist = {}
+    blacklist = defaultdict(set)
     with open(f_path, 'r') as f:
-        line = f.readline()
-        while line:
+        for line in f:
             w, m = line.split(',')
-            if w not in blacklist:
-                blacklist[w] = set()
             blacklist[w].add(m.strip())
-            line = f.readline()
-    return blacklist
+    return dict(blacklist)
+
+
+def _one_trial(
+        seed: np.random.SeedSequence,
+        w_prefs: List[np.ndarray],
+        m_prefs: List[np.ndarray],
+) -> np.ndarray:
+    """Runs a single random completion of the stable marriage problem
+
+    Args:
+        seed: seed for this trial's random number generator
+        w_prefs: women's integer encoded preference lists
+        m_prefs: men's integer encoded preference lists
+
+    Returns:
+        np.ndarray: man matched to each woman
+    """
+    rng = np.random.default_rng(seed)
+    n = len(w_prefs)
+
+    # Complete any incomplete lists
+    w_c = complete_ids(w_prefs, n, rng)
+    m_c = complete_ids(m_prefs, n, rng)
+
+    # Solve the SMP
+    reverse_matches = smp.solve_ids(w_c, m_c, rng=rng)
+    matches = np.empty(n, dtype=reverse_matches.dtype)
+    matches[reverse_matches] = np.arange(n)
+    return matches
+
+
+def _score_trial(
+        matches_ids: np.ndarray,
+        banned: Optional[np.ndarray],
+        w_prefs: Prefs,
+        m_prefs: Prefs,
+        men: Encoder,
+        score_fn,
+        warp_fn,
+        weight: float,
+        b: float,
+) -> Optional[Tuple[Dict[str, str], float, Dict[str, float], Dict[str, float]]]:
+    """Scores the matches found by a trial
+
+    Args:
+        matches_ids: man matched to each woman
+        banned: banned[w, m] is True if man m is in woman w's blacklist, None if there is no blacklist
+        w_prefs: women's integer encoded preference lists
+        m_prefs: men's integer encoded preference lists
+        men: encoder of the men
+        score_fn: scoring function
+        warp_fn: warping function
+        weight: weight to be assigned to the women's score
+        b: boost level
+
+    Returns:
+        (dict, float, dict, dict): matches (keyed by women), overall score and individual scores, or None if the
+            solution is blacklisted
+    """
+    # Throw out the solution if it is in the blacklist
+    if banned is not None and banned[np.arange(len(matches_ids)), matches_ids].any():
+        return None
+
+    # Get the scores
+    reverse_matches_ids = np.empty_like(matches_ids)
+    reverse_matches_ids[matches_ids] = np.arange(len(matches_ids))
+    w_scores, w_total = score_vec(matches_ids, w_prefs, score_fn=score_fn, warp_fn=warp_fn, b=b)
+    m_scores, m_total = score_vec(reverse_matches_ids, m_prefs, score_fn=score_fn, warp_fn=warp_fn, b=b)
+    overall_raw = weight * w_total + (1 - weight) * m_total
+    overall = overall_raw / len(matches_ids)
+
+    # Decode back to names for reporting
+    matches = dict(zip(w_prefs.ids, men.decode(matches_ids)))
+    w_scores = dict(zip(w_prefs.ids, w_scores.tolist()))
+    m_scores = dict(zip(m_prefs.ids, m_scores.tolist()))
+
+    return matches, overall, w_scores, m_scores
 
 
 def run_smp(
@@ -105,51 +189,88 @@ def run_smp(
         warp_fn: warping function
         args: arguments from command line
     """
-    def compute_score(matches, prefs):
-        return score_assignment(matches, prefs, score_fn=score_fn, warp_fn=warp_fn, b=args.boost)
-
     problem_size = len(w_prefs)
 
-    results = []
-    best_score = best = None
-    num_discarded = 0
-    for i in tqdm(range(args.n)):
-        # Complete any incomplete lists
-        w_c, m_c = complete(w_prefs, m_prefs)
-
-        # Solve the SMP
-        reverse_matches = smp.solve(w_c, m_c)
-        matches = {reverse_matches[m]: m for m in reverse_matches}
-
-        # Throw out the solution if it is in the blacklist
-        discard = False
-        for w in matches:
-            if w in blacklist and matches[w] in blacklist[w]:
-                discard = True
-                break
-        if discard:
-            num_discarded += 1
-            continue
-
-        # Get the scores
-        w_scores, w_total = compute_score(matches, w_prefs)
-        m_scores, m_total = compute_score(reverse_matches, m_prefs)
-        overall_raw = args.weight * w_total + (1 - args.weight) * m_total
-        overall = overall_raw / problem_size
-
-        # Update best result
-        if best_score == None or overall > best_score:
-            best_score = overall
-            best = matches
-
-        results.append({
-            'w_c': w_c,
-            'm_c': m_c,
-            'match': matches,
-            'overall': overall,
-            'w_scores': w_scores,
-            'm_scores': m_scores
-        })
+    if len(m_prefs) != problem_size:
+        raise Exception('number of men != number of women')
+
+    # Names that aren't in the problem would otherwise be dropped silently when encoding
+    smp.validate_partial_prefs(w_prefs, set(m_prefs))
+    smp.validate_partial_prefs(m_prefs, set(w_prefs))
+
+    # Encode everyone as integers once; names are only decoded again to report distinct matches
+    women = Encoder(w_prefs)
+    men = Encoder(m_prefs)
+    w_prefs_enc = Prefs.from_dict(w_prefs, men, women)
+    m_prefs_enc = Prefs.from_dict(m_prefs, women, men)
+    banned = encode_blacklist(blacklist, women.id_to_int, men.id_to_int) if blacklist else None
+
+    # Every trial is independent, so give each its own seed and farm them out to the workers
+    root_seed = np.random.SeedSequence(args.seed)
+    seeds = root_seed.spawn(args.n)
+    trial = functools.partial(_one_trial, w_prefs=w_prefs_enc.rows(), m_prefs=m_prefs_enc.rows())
+    workers = max(1, args.workers or 1)
+
+    # Different completions often lead to the same matches, so only check and score each distinct one once
+    scored = {}
+
+    # Stream the parameters and each trial to disk rather than holding every result in memory
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
+    with open(f'outputs/results{timestamp}.smp', 'wb') as f:
+        pickle.dump({
+            'scorer': args.scorer,
+            'warper': args.warper,
+            'boost': args.boost,
+            'weight': args.weight,
+            'seed': root_seed.entropy,
+            'women_prefs': w_prefs,
+            'men_prefs': m_prefs,
+            'blacklist': blacklist,
+            'problem_size': problem_size,
+        }, f)
+
+        best_score = best = None
+        num_discarded = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            trials = executor.map(trial, seeds, chunksize=max(1, args.n // workers)) if workers > 1 else map(trial, seeds)
+            if numba is not None and workers > 1:
+                # Results are scored here while the workers are still running trials, so only give the scoring
+                # kernels' threads the cores the workers leave free. This has to wait until map has started the
+                # workers, as forking after numba's thread pool is up can hang the process on exit
+                numba.set_num_threads(max(1, min(numba.config.NUMBA_NUM_THREADS, (os.cpu_count() or 1) - workers)))
+            for seed, matches_ids in zip(seeds, tqdm(trials, total=args.n)):
+                key = matches_ids.tobytes()
+                if key not in scored:
+                    scored[key] = _score_trial(
+                        matches_ids, banned, w_prefs_enc, m_prefs_enc, men, score_fn, warp_fn,
+                        args.weight, args.boost,
+                    )
+                result = scored[key]
+
+                if result is None:
+                    num_discarded += 1
+                    continue
+                matches, overall, w_scores, m_scores = result
+
+                # Update best result
+                if best_score == None or overall > best_score:
+                    best_score = overall
+                    best = matches
+
+                # The completed preferences can be regenerated from the seed, so they aren't saved
+                pickle.dump({
+                    'seed': seed,
+                    'match': matches,
+                    'overall': overall,
+                    'w_scores': w_scores,
+                    'm_scores': m_scores
+                }, f)
+
+        pickle.dump({
+            'best': best,
+            'best_score': best_score,
+            'num_discarded': num_discarded,
+        }, f)
 
     print('')
     print('###########')
@@ -165,25 +286,31 @@ def run_smp(
     for w in sorted(best.keys()):
         print(f'    {w} - {best[w]}')
 
-    # Save parameters, outputs in dict
-    output = {
-        'scorer': args.scorer,
-        'warper': args.warper,
-        'boost': args.boost,
-        'weight': args.weight,
-        'women_prefs': w_prefs,
-        'men_prefs': m_prefs,
-        'blacklist': blacklist,
-        'problem_size': problem_size,
-        'best': best,
-        'best_score': best_score,
-        'results': results
-    }
+    print('\nfin')
 
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
-    pickle.dump(output, open(f'outputs/results{timestamp}.smp', 'wb'))
 
-    print('\nfin')
+def read_results(f_path: str) -> Dict:
+    """Read the results streamed to disk by run_smp
+
+    Args:
+        f_path: path to file
+
+    Returns:
+        dict: parameters, best result and the list of individual results
+    """
+    with open(f_path, 'rb') as f:
+        output = pickle.load(f)
+        records = []
+        while True:
+            try:
+                records.append(pickle.load(f))
+            except EOFError:
+                break
+
+    # The last record is the summary written once all the trials finished
+    output.update(records.pop())
+    output['results'] = records
+    return output
 
 
 def run_hungarian(
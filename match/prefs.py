@@ -0,0 +1,110 @@
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from .utils import encode_prefs, pad_prefs
+
+
+class Encoder:
+    """Two way map between names and small integer ids, assigned in sorted order of the names"""
+    __slots__ = ('id_to_int', 'int_to_id')
+
+    def __init__(self, names: Iterable[str]):
+        """
+        Args:
+            names: names to encode
+        """
+        self.int_to_id = sorted(names)
+        self.id_to_int = {name: i for i, name in enumerate(self.int_to_id)}
+
+    def __len__(self) -> int:
+        return len(self.int_to_id)
+
+    def encode(self, names: Iterable[str]) -> np.ndarray:
+        """Encode names as ids
+
+        Args:
+            names: names to encode
+
+        Returns:
+            np.ndarray: id of each name
+        """
+        return np.fromiter((self.id_to_int[name] for name in names), dtype=np.int32)
+
+    def decode(self, ids: np.ndarray) -> List[str]:
+        """Decode ids back to names
+
+        Args:
+            ids: ids to decode
+
+        Returns:
+            list: name of each id
+        """
+        return [self.int_to_id[i] for i in ids.tolist()]
+
+
+class Prefs:
+    """Integer encoded preference lists, one row per person, for the vectorized scorers"""
+    __slots__ = ('ids', 'matrix', 'lengths', 'n_choices', '_ranks', '_membership')
+
+    def __init__(self, ids: List[str], matrix: np.ndarray, n_choices: int):
+        """
+        Args:
+            ids: name of the person on each row
+            matrix: matrix[x, k] is the k-th choice of person x, padded with -1, with no choice repeated in a row
+            n_choices: number of possible choices
+        """
+        self.ids = ids
+        self.matrix = matrix
+        self.lengths = np.count_nonzero(matrix >= 0, axis=1)
+        self.n_choices = n_choices
+        self._ranks = None
+        self._membership = None
+
+    @classmethod
+    def from_dict(
+            cls,
+            prefs: Dict[str, List[str]],
+            choices: Encoder,
+            people: Optional[Encoder] = None,
+    ) -> 'Prefs':
+        """Encode a dict of preference lists
+
+        Args:
+            prefs: ordered preference lists keyed by person
+            choices: encoder of the possible choices
+            people: encoder giving the order to put the people in, the order of prefs if not given
+
+        Returns:
+            Prefs: the encoded preference lists
+        """
+        ids = list(prefs) if people is None else people.int_to_id
+        return cls(ids, pad_prefs(encode_prefs(prefs, ids, choices.id_to_int)), len(choices))
+
+    def rows(self) -> List[np.ndarray]:
+        """Return the preference lists without their padding
+
+        Returns:
+            list: ordered array of choice ids for each person, aligned with ids
+        """
+        return [row[:n] for row, n in zip(self.matrix, self.lengths.tolist())]
+
+    @property
+    def ranks(self) -> np.ndarray:
+        """ranks[x, c] is the rank of choice c in person x's list, or the length of the list if c isn't in it"""
+        if self._ranks is None:
+            ranks = np.repeat(self.lengths[:, None].astype(np.int32), self.n_choices, axis=1)
+            rows, cols = np.nonzero(self.matrix >= 0)
+            ranks[rows, self.matrix[rows, cols]] = cols
+            self._ranks = ranks
+        return self._ranks
+
+    @property
+    def membership(self) -> np.ndarray:
+        """membership[x, c] is whether choice c is in person x's list at all"""
+        if self._membership is None:
+            membership = np.zeros((len(self.matrix), self.n_choices), dtype=bool)
+            rows, cols = np.nonzero(self.matrix >= 0)
+            membership[rows, self.matrix[rows, cols]] = True
+            self._membership = membership
+        return self._membership
@@ -1,41 +1,106 @@
-from typing import List, Dict, Tuple
+import functools
+import math
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable, List, Dict, Optional, Tuple, Union
 
 import numpy as np
 
+if TYPE_CHECKING:
+    from .prefs import Encoder, Prefs
+
+try:
+    from . import score_numba
+except ImportError:
+    score_numba = None
+
+# Ahead of time compiled kernels, only present if built with `python -m match.build_kernels`
+try:
+    from . import _score_kernels
+except ImportError:
+    _score_kernels = None
+
+RankTables = Tuple[Dict[str, Dict[str, int]], Dict[str, int]]
+
+_INV_EXPM1_1 = 1.0 / math.expm1(1.0)
+
+# Rows per tile in score_many; 64 rows of int32 ranks stay within L2 for up to a few thousand choices
+SCORE_MANY_TILE = 64
+
+# Rank tables of the last few raw preference dicts passed to score_assignment, keyed by id
+_RANK_TABLES_CACHE_SIZE = 8
+_rank_tables_cache = OrderedDict()
+
+
+def build_rank_tables(prefs: Dict[str, List[str]]) -> RankTables:
+    """Precompute the rank of every choice in each preference list
+
+    Args:
+        prefs: ordered preference lists keyed by person
+
+    Returns:
+        (dict, dict): map from person to {choice: rank} and map from person to preference list length, where a
+            repeated choice only counts where it first appears
+    """
+    ranks = {p: {name: i for i, name in enumerate(dict.fromkeys(prefs[p]))} for p in prefs}
+    lengths = {p: len(ranks[p]) for p in prefs}
+    return ranks, lengths
+
+
+def _cached_rank_tables(prefs: Dict[str, List[str]]) -> RankTables:
+    """Return the rank tables of prefs, only building them the first time the same dict is seen
+
+    The cache holds on to prefs so its id can't be reused, but the preference lists must not be modified in between
+
+    Args:
+        prefs: ordered preference lists keyed by person
+
+    Returns:
+        (dict, dict): rank tables as returned by build_rank_tables
+    """
+    key = id(prefs)
+    entry = _rank_tables_cache.get(key)
+    if entry is not None and entry[0] is prefs:
+        _rank_tables_cache.move_to_end(key)
+        return entry[1]
+
+    rank_tables = build_rank_tables(prefs)
+    _rank_tables_cache[key] = (prefs, rank_tables)
+    if len(_rank_tables_cache) > _RANK_TABLES_CACHE_SIZE:
+        _rank_tables_cache.popitem(last=False)
+    return rank_tables
+
 
 ################
 # Base Scorers #
 ################
 
-def one_zero(match: str, prefs: List[str]) -> int:
+def one_zero(match: str, ranks: Dict[str, int], n: int) -> int:
     """Score 1 if the match is in the prefs list and 0 otherwise
 
     Args:
          match: name of the match
-         prefs: ordered list of preferences
+         ranks: rank of each choice in the preference list
+         n: length of the preference list
 
     Returns:
         float: the score
     """
-    return 1 if match in prefs else 0
+    return 1 if match in ranks else 0
 
 
-def frac(match: str, prefs: List[str]) -> float:
+def frac(match: str, ranks: Dict[str, int], n: int) -> float:
     """Earn a score equivalent to (n - i) / n. Earn 0 if match is not in prefs
 
     Args:
          match: name of the match
-         prefs: ordered list of preferences
+         ranks: rank of each choice in the preference list
+         n: length of the preference list
 
     Returns:
         float: the score
     """
-    if match not in prefs:
-        return 0
-
-    n = len(prefs)
-    i = prefs.index(match)
-    return (n - i) / n
+    i = ranks.get(match)
+    return 0 if i is None else (n - i) / n
 
 
 #################
@@ -43,7 +108,7 @@ def frac(match: str, prefs: List[str]) -> float:
 #################
 
 def boost(base_score: float, b: float = 1) -> float:
-    """"Boost" non-zero scores by some amount b
+    """"Boost" non-zero scores by some amount b, without branching so it also works on arrays of scores
 
     Args:
          base_score: score to augment
@@ -52,7 +117,7 @@ def boost(base_score: float, b: float = 1) -> float:
     Returns:
         float: the score
     """
-    return base_score + b if base_score > 0 else 0
+    return base_score + b * (base_score > 0)
 
 
 def identity(base_score: float) -> float:
@@ -76,19 +141,20 @@ def exponential(base_score: float) -> float:
     Returns:
           float: the score
     """
-    return (np.exp(base_score) - 1) / (np.exp(1) - 1)
+    return math.expm1(base_score) * _INV_EXPM1_1
 
 
 ###########
 # Scoring #
 ###########
 
-def score(match: str, prefs: List[str], score_fn=one_zero, warp_fn=identity, b=0) -> float:
+def score(match: str, ranks: Dict[str, int], n: int, score_fn=one_zero, warp_fn=identity, b=0) -> float:
     """Return the uni-directional score earned by a match between a and b given a's preference list
 
     Args:
         match: name of the match
-        prefs: ordered preference list
+        ranks: rank of each choice in the preference list
+        n: length of the preference list
         score_fn: scoring function to use
         warp_fn: warping function to use
         b: boost level
@@ -96,34 +162,93 @@ def score(match: str, prefs: List[str], score_fn=one_zero, warp_fn=identity, b=0
     Returns:
         float: the score
     """
-    return boost(warp_fn(score_fn(match, prefs)), b=b)
+    return boost(warp_fn(score_fn(match, ranks, n)), b=b)
+
 
+@functools.lru_cache(maxsize=None)
+def make_scorer(score_fn=one_zero, warp_fn=identity, b=0) -> Callable[[str, Dict[str, int], int], float]:
+    """Return a function equivalent to score with the given score_fn, warp_fn and b, specialized to avoid calling
+    through score_fn and warp_fn for every match where the combination is known. Scorers are cached and reused
 
-def score_exponential(match: str, prefs: List[str]) -> float:
+    Args:
+        score_fn: scoring function to use
+        warp_fn: warping function to use
+        b: boost level
+
+    Returns:
+        function: scorer taking (match, ranks, n)
+    """
+    if score_fn is one_zero:
+        # Only two scores are possible, so work them out up front
+        hit = boost(warp_fn(1), b=b)
+        miss = boost(warp_fn(0), b=b)
+
+        def scorer(match, ranks, n):
+            return hit if match in ranks else miss
+    elif score_fn is frac and warp_fn is identity:
+        def scorer(match, ranks, n):
+            i = ranks.get(match)
+            return 0 if i is None else (n - i) / n + b
+    elif score_fn is frac and warp_fn is exponential:
+        def scorer(match, ranks, n):
+            i = ranks.get(match)
+            return 0.0 if i is None else math.expm1((n - i) / n) * _INV_EXPM1_1 + b
+    else:
+        def scorer(match, ranks, n):
+            return boost(warp_fn(score_fn(match, ranks, n)), b=b)
+
+    return scorer
+
+
+def score_exponential(match: str, ranks: Dict[str, int], n: int) -> float:
     """Default exponential scoring function
 
     Args:
         match: name of the match
-        prefs: ordered preference list
+        ranks: rank of each choice in the preference list
+        n: length of the preference list
 
     Returns:
         float: the score
     """
-    return score(match, prefs, score_fn=frac, warp_fn=exponential, b=1)
+    return score(match, ranks, n, score_fn=frac, warp_fn=exponential, b=1)
+
+
+def score_exponential_matrix(frac_matrix: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Apply score_exponential's warp and boost to a whole matrix of frac scores at once
+
+    Args:
+        frac_matrix: matrix of frac scores
+        out: optional buffer to write the scores to, which may be frac_matrix itself
+
+    Returns:
+        np.ndarray: matrix of scores
+    """
+    if score_numba is not None:
+        return score_numba.exp_boost(frac_matrix, 1.0, out=out)
+
+    ranked = frac_matrix > 0
+    out = np.expm1(frac_matrix, out=out)
+    out *= _INV_EXPM1_1
+    out += ranked
+    return out
 
 
 def score_assignment(
         matches: Dict[str, str],
-        prefs: Dict[str, List[str]],
+        rank_tables: Union[RankTables, Dict[str, List[str]]],
         score_fn=one_zero,
         warp_fn=identity,
         b=0,
-) -> Tuple[Dict[str, float], np.ndarray]:
+) -> Tuple[Dict[str, float], float]:
     """Return the score earned by each match and the aggregate sum
 
     Args:
          matches: dictionary of matches
-         prefs: ordered preference lists keyed by person
+         rank_tables: rank tables of the preference lists (see build_rank_tables), or the ordered preference lists
+            keyed by person, whose rank tables are then built and cached by the identity of the dict. A dict passed
+            this way must not be modified in place afterwards, or later calls will score against its stale ranks;
+            pass a new dict or prebuilt rank tables instead
          score_fn: scoring function
          warp_fn: warping function
          b: boost level
@@ -131,7 +256,202 @@ def score_assignment(
     Returns:
         (dict, float): scores of each individual and overall score
     """
-    def score_individual(m: str, p: List[str]) -> float:
-        return score(m, p, score_fn=score_fn, warp_fn=warp_fn, b=b)
-    scores = {x: score_individual(matches[x], prefs[x]) for x in matches}
-    return scores, np.sum([scores[x] for x in scores])
+    if isinstance(rank_tables, dict):
+        rank_tables = _cached_rank_tables(rank_tables)
+
+    ranks, lengths = rank_tables
+    scorer = make_scorer(score_fn, warp_fn, b)
+
+    # One pass over the matches, totalling as we go rather than summing the scores afterwards
+    scores = {}
+    total = 0.0
+    for x, m in matches.items():
+        s = scorer(m, ranks[x], lengths[x])
+        scores[x] = s
+        total += s
+    return scores, total
+
+
+def score_matches(
+        matches: Dict[str, str],
+        prefs: 'Prefs',
+        choices: 'Encoder',
+        score_fn=one_zero,
+        warp_fn=identity,
+        b=0,
+        as_dict: bool = True,
+) -> Tuple[Union[Dict[str, float], np.ndarray], float]:
+    """score_assignment for dict matches against integer encoded preferences, which are encoded once here so only
+    arrays reach the vectorized and compiled scorers
+
+    Args:
+        matches: dictionary of matches, with an entry for everyone in prefs.ids
+        prefs: integer encoded preference lists
+        choices: encoder the choices in prefs were encoded with
+        score_fn: scoring function, one_zero or frac
+        warp_fn: warping function, identity or exponential
+        b: boost level
+        as_dict: whether to return the individual scores keyed by person, rather than as an array aligned with prefs.ids
+
+    Returns:
+        (dict or np.ndarray, float): scores of each individual and overall score
+    """
+    matches_ids = choices.encode(matches[x] for x in prefs.ids)
+    scores, total = score_vec(matches_ids, prefs, score_fn=score_fn, warp_fn=warp_fn, b=b)
+    if as_dict:
+        return dict(zip(prefs.ids, scores.tolist())), total
+    return scores, total
+
+
+def one_zero_vec(matches: np.ndarray, prefs: 'Prefs') -> np.ndarray:
+    """Vectorized one_zero over integer encoded matches and preferences
+
+    Args:
+        matches: id of the match of each person, aligned with prefs.ids
+        prefs: integer encoded preference lists
+
+    Returns:
+        np.ndarray: the scores, aligned with prefs.ids
+    """
+    return prefs.membership[np.arange(len(matches)), matches].astype(np.float64)
+
+
+def score_vec(
+        matches: np.ndarray,
+        prefs: 'Prefs',
+        score_fn=one_zero,
+        warp_fn=identity,
+        b=0,
+) -> Tuple[np.ndarray, float]:
+    """Vectorized score_assignment over integer encoded matches and preferences
+
+    Args:
+        matches: id of the match of each person, aligned with prefs.ids
+        prefs: integer encoded preference lists
+        score_fn: scoring function, one_zero or frac
+        warp_fn: warping function, identity or exponential
+        b: boost level
+
+    Returns:
+        (np.ndarray, float): scores of each individual, aligned with prefs.ids, and overall score
+    """
+    if score_fn is frac and warp_fn is identity:
+        if _score_kernels is not None:
+            scores = _score_kernels.score_frac_boost(
+                matches.astype(np.int64, copy=False), prefs.matrix.astype(np.int32, copy=False), float(b),
+            )
+            return scores, float(scores.sum())
+        if score_numba is not None:
+            return score_numba._score_frac_boost(matches, prefs.matrix, float(b))
+
+    if score_fn is one_zero:
+        # Only membership matters, which doesn't need the full rank matrix
+        base = one_zero_vec(matches, prefs)
+    elif score_fn is frac:
+        # Unranked matches have a rank equal to the length of the list
+        n = prefs.lengths
+        i = prefs.ranks[np.arange(len(matches)), matches]
+        base = (n - i) / np.maximum(n, 1)
+    else:
+        raise ValueError(f'no vectorized version of scoring function {score_fn.__name__}')
+
+    scores = _warp_boost_vec(base, warp_fn, b)
+    return scores, float(scores.sum())
+
+
+def score_csr(matches: np.ndarray, indptr: np.ndarray, data: np.ndarray, b=0) -> Tuple[np.ndarray, float]:
+    """score_vec with frac and the identity warp over CSR style preference lists (see utils.to_csr), which saves
+    padding every list out to the longest one when their lengths vary a lot
+
+    Args:
+        matches: id of the match of each person
+        indptr: person x's list is data[indptr[x]:indptr[x + 1]]
+        data: concatenated preference lists
+        b: boost level
+
+    Returns:
+        (np.ndarray, float): scores of each individual and overall score
+    """
+    if score_numba is not None:
+        return score_numba._score_csr(matches, indptr, data, float(b))
+
+    # Find the one position, if any, in each person's list that holds their match
+    n = np.diff(indptr)
+    owner = np.repeat(np.arange(len(matches)), n)
+    pos = np.flatnonzero(data == matches[owner])
+    x = owner[pos]
+    i = pos - indptr[x]
+
+    scores = np.zeros(len(matches))
+    scores[x] = (n[x] - i) / n[x] + b
+    return scores, float(scores.sum())
+
+
+def score_many(
+        matches_over_rounds: np.ndarray,
+        prefs: 'Prefs',
+        score_fn=one_zero,
+        warp_fn=identity,
+        b=0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """score_vec over several sets of matches against the same preferences at once
+
+    People are worked through in tiles of SCORE_MANY_TILE rows, gathering every round's scores for a tile before
+    moving on so that tile of the rank table stays in cache instead of the whole table being read once per round
+
+    Args:
+        matches_over_rounds: matches_over_rounds[r, x] is the id of the match of person x in round r
+        prefs: integer encoded preference lists
+        score_fn: scoring function, one_zero or frac
+        warp_fn: warping function, identity or exponential
+        b: boost level
+
+    Returns:
+        (np.ndarray, np.ndarray): scores[r, x] of each individual in each round and the overall score of each round
+    """
+    matches_over_rounds = np.atleast_2d(matches_over_rounds)
+    if score_fn is one_zero:
+        table = prefs.membership
+    elif score_fn is frac:
+        table = prefs.ranks
+    else:
+        raise ValueError(f'no vectorized version of scoring function {score_fn.__name__}')
+
+    n_people = matches_over_rounds.shape[1]
+    base = np.empty(matches_over_rounds.shape, dtype=np.float64)
+    for start in range(0, n_people, SCORE_MANY_TILE):
+        stop = min(start + SCORE_MANY_TILE, n_people)
+        tile = table[start:stop]
+        hit = tile[np.arange(stop - start), matches_over_rounds[:, start:stop]]
+        if score_fn is one_zero:
+            base[:, start:stop] = hit
+        else:
+            n = prefs.lengths[start:stop]
+            base[:, start:stop] = (n - hit) / np.maximum(n, 1)
+
+    scores = _warp_boost_vec(base, warp_fn, b)
+    return scores, scores.sum(axis=1)
+
+
+def _warp_boost_vec(base: np.ndarray, warp_fn, b) -> np.ndarray:
+    """Apply warp_fn and then the boost to an array of base scores
+
+    Args:
+        base: base scores
+        warp_fn: warping function, identity or exponential
+        b: boost level
+
+    Returns:
+        np.ndarray: the scores
+    """
+    if warp_fn is not exponential and warp_fn is not identity:
+        raise ValueError(f'no vectorized version of warping function {warp_fn.__name__}')
+
+    if score_numba is not None:
+        # One pass through the warp and the boost
+        warp_boost = score_numba.exp_boost if warp_fn is exponential else score_numba.identity_boost
+        return warp_boost(base, float(b))
+
+    if warp_fn is exponential:
+        base = np.expm1(base) * _INV_EXPM1_1
+    return boost(base, b=b)
@@ -0,0 +1,95 @@
+import math
+
+import numpy as np
+from numba import njit, prange, vectorize
+
+_INV_EXPM1_1 = 1.0 / math.expm1(1.0)
+
+
+@vectorize(['float32(float32, float32)', 'float64(float64, float64)'], fastmath=True, cache=True)
+def exp_boost(x, b):
+    """Fused exponential warp and boost of a base score
+
+    Args:
+        x: base score
+        b: boost level
+
+    Returns:
+        float: the score
+    """
+    if x <= 0.0:
+        return 0.0
+    return math.expm1(x) * _INV_EXPM1_1 + b
+
+
+@vectorize(['float32(float32, float32)', 'float64(float64, float64)'], fastmath=True, cache=True)
+def identity_boost(x, b):
+    """Fused identity warp and boost of a base score
+
+    Args:
+        x: base score
+        b: boost level
+
+    Returns:
+        float: the score
+    """
+    if x <= 0.0:
+        return 0.0
+    return x + b
+
+
+@njit(parallel=True, cache=True, fastmath=True)
+def _score_frac_boost(matches: np.ndarray, prefs: np.ndarray, b: float):
+    """Score integer encoded matches with frac, the identity warp and a boost of b
+
+    Every row is independent, so the rows are split across threads
+
+    Args:
+        matches: id of the match of each person
+        prefs: prefs[x, k] is the k-th choice of person x, padded with -1
+        b: boost level
+
+    Returns:
+        (np.ndarray, float): scores of each individual and overall score
+    """
+    N, L = prefs.shape
+    out = np.zeros(N)
+    for x in prange(N):
+        # Length of the real part of the row
+        n = 0
+        while n < L and prefs[x, n] >= 0:
+            n += 1
+
+        m = matches[x]
+        for i in range(n):
+            if prefs[x, i] == m:
+                out[x] = (n - i) / n + b
+                break
+    return out, out.sum()
+
+
+@njit(parallel=True, cache=True, fastmath=True)
+def _score_csr(matches: np.ndarray, indptr: np.ndarray, data: np.ndarray, b: float):
+    """_score_frac_boost over CSR style preference lists (see utils.to_csr)
+
+    Args:
+        matches: id of the match of each person
+        indptr: person x's list is data[indptr[x]:indptr[x + 1]]
+        data: concatenated preference lists
+        b: boost level
+
+    Returns:
+        (np.ndarray, float): scores of each individual and overall score
+    """
+    N = matches.shape[0]
+    out = np.zeros(N)
+    for x in prange(N):
+        start = indptr[x]
+        n = indptr[x + 1] - start
+
+        m = matches[x]
+        for i in range(n):
+            if data[start + i] == m:
+                out[x] = (n - i) / n + b
+                break
+    return out, out.sum()
@@ -1,56 +1,127 @@
-from typing import Dict, List, Set
+from collections import deque
+from typing import Dict, List, Optional, Set
 
-import copy
 import numpy as np
 
+try:
+    from . import smp_numba
+except ImportError:
+    smp_numba = None
 
-def solve(w_prefs_i: Dict[str, List[str]], m_prefs_i: Dict[str, List[str]]) -> Dict[str, str]:
+
+def solve(
+        w_prefs_i: Dict[str, List[str]],
+        m_prefs_i: Dict[str, List[str]],
+        rng: Optional[np.random.Generator] = None,
+) -> Dict[str, str]:
     """Return a dictionary of matches, keyed by men, for the stable marriage problem
 
     Args:
         w_prefs_i: incomplete preference dict for the women
         m_prefs_i: incomplete preference dict for the men
+        rng: random number generator used to order the proposals, a fresh one is used if not given
 
     Returns:
         Dictionary containing map from woman to man
     """
     validate_input(m_prefs_i, w_prefs_i)
-    
-    # Make a copy so we don't alter the original input
-    w_prefs = copy.deepcopy(w_prefs_i)
-    m_prefs = copy.deepcopy(m_prefs_i)
+
+    # Encode names as integers once so the solver only deals with arrays
+    women = list(w_prefs_i.keys())
+    men = list(m_prefs_i.keys())
+    w_id = {w: i for i, w in enumerate(women)}
+    m_id = {m: i for i, m in enumerate(men)}
+
+    n = len(women)
+
+    w_prefs_arr = np.array([[m_id[m] for m in w_prefs_i[w]] for w in women], dtype=np.int32).reshape(n, n)
+    m_prefs_arr = np.array([[w_id[w] for w in m_prefs_i[m]] for m in men], dtype=np.int32).reshape(n, n)
+
+    matches = solve_ids(w_prefs_arr, m_prefs_arr, rng=rng)
+
+    return {men[m]: women[w] for m, w in enumerate(matches.tolist()) if w != -1}
+
+
+def solve_ids(
+        w_prefs_arr: np.ndarray,
+        m_prefs_arr: np.ndarray,
+        rng: Optional[np.random.Generator] = None,
+) -> np.ndarray:
+    """Solve the stable marriage problem on integer encoded, complete preferences
+
+    Args:
+        w_prefs_arr: w_prefs_arr[i, k] is the k-th choice of woman i
+        m_prefs_arr: m_prefs_arr[j, k] is the k-th choice of man j
+        rng: random number generator used to order the proposals, a fresh one is used if not given
+
+    Returns:
+        np.ndarray: woman matched to each man
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    n = w_prefs_arr.shape[0]
+
+    # Rank of each woman in each man's list
+    m_rank_arr = np.empty((n, n), dtype=np.int32)
+    m_rank_arr[np.arange(n)[:, None], m_prefs_arr] = np.arange(n, dtype=np.int32)
+
+    # Shuffled order the women start proposing in
+    perm = rng.permutation(n)
+
+    if smp_numba is not None:
+        return smp_numba._solve_smp(w_prefs_arr, m_rank_arr, perm)
+    return _solve_smp(w_prefs_arr, m_rank_arr, perm)
+
+
+def _solve_smp(w_prefs_arr: np.ndarray, m_rank_arr: np.ndarray, perm: np.ndarray) -> np.ndarray:
+    """Pure Python Gale-Shapley on integer encoded preferences, see smp_numba._solve_smp
+
+    Args:
+        w_prefs_arr: w_prefs_arr[i, k] is the k-th choice of woman i
+        m_rank_arr: m_rank_arr[m, w] is the rank of woman w in man m's list
+        perm: order in which the women start proposing
+
+    Returns:
+        np.ndarray: woman matched to each man
+    """
+    w_prefs = w_prefs_arr.tolist()
+    m_rank = m_rank_arr.tolist()
 
     n = len(w_prefs)
 
-    # Shuffled list of women who are free
-    free = list(np.random.permutation(list(w_prefs.keys())).tolist())
-    # Set of women who are finished proposing
-    done = set()
-    # Set of matches
-    matches = {}
+    # Queue of women who are free
+    free = deque(perm.tolist())
+    # Index of the next choice each woman will propose to
+    next_choice = [0] * n
+    # Number of women who are finished proposing
+    num_done = 0
+    # Woman matched to each man
+    matches = [-1] * n
 
-    while len(free) and len(done) < n:
+    while len(free) and num_done < n:
         # Get the next free woman and her top choice
-        w = free.pop(0)
-        m = w_prefs[w].pop(0)
-        
+        w = free.popleft()
+        m = w_prefs[w][next_choice[w]]
+        next_choice[w] += 1
+
         # If there are no more men to propose to, mark m as done
-        if len(w_prefs[w]) == 0:
-            done.add(w)
+        if next_choice[w] == n:
+            num_done += 1
 
-        if m not in matches:
+        if matches[m] == -1:
             # Man is free so he accepts
             matches[m] = w
         else:
             # Jilt if current match w_prime is less desirable
             w_prime = matches[m]
-            if m_prefs[m].index(w) < m_prefs[m].index(w_prime):
+            if m_rank[m][w] < m_rank[m][w_prime]:
                 matches[m] = w
                 free.append(w_prime)
             else:
                 free.append(w)
 
-    return matches
+    return np.array(matches)
 
 
 def validate_input(m_prefs: Dict[str, List[str]], w_prefs: Dict[str, List[str]]) -> None:
@@ -81,3 +152,14 @@ def validate_prefs(prefs: Dict[str, List[str]], choices: Set[str]):
         if set(pref_list) != choices:
             raise Exception('incomplete list of prefs in input')
 
+
+def validate_partial_prefs(prefs: Dict[str, List[str]], choices: Set[str]):
+    """Ensure all, possibly incomplete, preference lists only name valid choices
+
+   Args:
+        prefs: Dictionary of preferences
+        choices: Set of choices
+    """
+    for _, pref_list in prefs.items():
+        if not choices.issuperset(pref_list):
+            raise Exception('incomplete list of prefs in input')
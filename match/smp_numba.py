@@ -0,0 +1,56 @@
+import numpy as np
+from numba import njit
+
+
+@njit(cache=True)
+def _solve_smp(w_prefs_arr: np.ndarray, m_rank_arr: np.ndarray, perm: np.ndarray) -> np.ndarray:
+    """Gale-Shapley on integer encoded preferences
+
+    Args:
+        w_prefs_arr: w_prefs_arr[i, k] is the k-th choice of woman i
+        m_rank_arr: m_rank_arr[m, w] is the rank of woman w in man m's list
+        perm: order in which the women start proposing
+
+    Returns:
+        np.ndarray: woman matched to each man
+    """
+    n = w_prefs_arr.shape[0]
+
+    # Ring buffer of women who are free
+    free = perm.copy()
+    head = 0
+    tail = 0
+    num_free = n
+    # Next choice each woman will propose to
+    next_choice = np.zeros(n, dtype=np.int64)
+    # Number of women who are finished proposing
+    num_done = 0
+    matches = np.full(n, -1, dtype=np.int64)
+
+    while num_free > 0 and num_done < n:
+        # Get the next free woman and her top choice
+        w = free[head]
+        head = (head + 1) % n
+        num_free -= 1
+        m = w_prefs_arr[w, next_choice[w]]
+        next_choice[w] += 1
+
+        if next_choice[w] == n:
+            num_done += 1
+
+        if matches[m] == -1:
+            # Man is free so he accepts
+            matches[m] = w
+        else:
+            # Jilt if current match w_prime is less desirable
+            w_prime = matches[m]
+            if m_rank_arr[m, w] < m_rank_arr[m, w_prime]:
+                matches[m] = w
+                free[tail] = w_prime
+            else:
+                free[tail] = w
+            tail = (tail + 1) % n
+            num_free += 1
+
+    return matches
+
@@ -1,39 +1,93 @@
-from typing import Dict, List, Tuple, Set
+from typing import Collection, Dict, List, Sequence, Tuple
 
 import numpy as np
 
 
-def complete(
-        w_prefs: Dict[str, List[str]],
-        m_prefs: Dict[str, List[str]],
-) -> Tuple[Dict[str, List[str]], Dict[str, List[str]]]:
-    """Given two incomplete preference dicts, complete them with a random permutation of the remaining choices
+def encode_prefs(prefs: Dict[str, List[str]], people: Sequence[str], choice_id: Dict[str, int]) -> List[np.ndarray]:
+    """Encode preference lists of names as arrays of integer ids
 
     Args:
-        w_prefs: map from woman name to ordered list of preferences
-        m_prefs: map from man name to ordered list of preferences
+        prefs: map from person to ordered list of preferences
+        people: order to encode the people in
+        choice_id: integer id of each choice, e.g. Encoder.id_to_int
 
     Returns:
-        Tuple of completed preference dicts
+        list: ordered array of choice ids for each person, aligned with people, with any repeated choice only kept
+            where it first appears
     """
-    women = set(w_prefs.keys())
-    men = set(m_prefs.keys())
+    return [
+        np.fromiter((choice_id[c] for c in dict.fromkeys(prefs[p]) if c in choice_id), dtype=np.int32)
+        for p in people
+    ]
 
-    w_prefs_c = {w: complete_prefs(w_prefs[w], men) for w in w_prefs}
-    m_prefs_c = {m: complete_prefs(m_prefs[m], women) for m in m_prefs}
 
-    return w_prefs_c, m_prefs_c
+def pad_prefs(prefs: List[np.ndarray]) -> np.ndarray:
+    """Stack integer encoded preference lists into a matrix, padding the shorter lists with -1
 
+    Args:
+        prefs: ordered array of choice ids for each person, as built by encode_prefs
+
+    Returns:
+        np.ndarray: padded preferences, one row per person, with at least one column
+    """
+    width = max((len(ids) for ids in prefs), default=0)
+    prefs_matrix = np.full((len(prefs), max(width, 1)), -1, dtype=np.int32)
+    for i, ids in enumerate(prefs):
+        prefs_matrix[i, :len(ids)] = ids
+    return prefs_matrix
+
+
+def to_csr(prefs: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Concatenate integer encoded preference lists into a CSR style layout, without padding
+
+    Args:
+        prefs: ordered array of choice ids for each person, as built by encode_prefs
+
+    Returns:
+        (np.ndarray, np.ndarray): indptr, where person x's list is data[indptr[x]:indptr[x + 1]], and data
+    """
+    indptr = np.zeros(len(prefs) + 1, dtype=np.int64)
+    np.cumsum([len(ids) for ids in prefs], out=indptr[1:])
+    data = np.concatenate(prefs).astype(np.int32, copy=False) if prefs else np.empty(0, dtype=np.int32)
+    return indptr, data
+
+
+def encode_blacklist(blacklist: Dict[str, Collection[str]], w_id: Dict[str, int], m_id: Dict[str, int]) -> np.ndarray:
+    """Encode a blacklist as a boolean matrix
+
+    Args:
+        blacklist: blacklists keyed by woman
+        w_id: integer id of each woman
+        m_id: integer id of each man
+
+    Returns:
+        np.ndarray: banned[w, m] is True if man m is in woman w's blacklist
+    """
+    banned = np.zeros((len(w_id), len(m_id)), dtype=bool)
+    for w, men in blacklist.items():
+        if w in w_id:
+            banned[w_id[w], [m_id[m] for m in men if m in m_id]] = True
+    return banned
 
-def complete_prefs(prefs: List[str], choices: Set[str]) -> List[str]:
-    """Given a single preference list, return a completed preference list with a permutation or the remaining choices
+
+def complete_ids(prefs: List[np.ndarray], n: int, rng: np.random.Generator) -> np.ndarray:
+    """Complete integer encoded preference lists with a random permutation of the remaining choices
 
     Args:
-        prefs: incomplete map from person to ordered list of preferences
-        choices: complete set of possible choices for the person
+        prefs: ordered array of choice ids for each person, as built by encode_prefs
+        n: number of possible choices
+        rng: random number generator
 
     Returns:
-        Completed preference dict
+        np.ndarray: completed preferences, one row per person
     """
-    remaining_choices = list(set(choices) - set(prefs))
-    return prefs + list(np.random.permutation(remaining_choices).tolist())
+    prefs_c = np.empty((len(prefs), n), dtype=np.int32)
+    for i, ids in enumerate(prefs):
+        mask = np.ones(n, dtype=bool)
+        mask[ids] = False
+        remaining = np.flatnonzero(mask)
+        rng.shuffle(remaining)
+        prefs_c[i, :len(ids)] = ids
+        prefs_c[i, len(ids):] = remaining
+    return prefs_c
+
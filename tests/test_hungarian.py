@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from scipy.optimize import linear_sum_assignment
+
+from match.hungarian import SPARSE_DENSITY, _assign, _solve_sparse
+
+
+def _total(score_matrix, row_ind, col_ind):
+    return score_matrix[row_ind, col_ind].sum()
+
+
+def _check_against_dense(score_matrix):
+    """Check the sparse solver and _assign give full assignments with the same total as the dense solver"""
+    expected = _total(score_matrix, *linear_sum_assignment(score_matrix, maximize=True))
+    n = score_matrix.shape[0]
+    for solver in (_solve_sparse, _assign):
+        row_ind, col_ind = solver(score_matrix.copy())
+        assert sorted(row_ind.tolist()) == list(range(n))
+        assert sorted(col_ind.tolist()) == list(range(n))
+        assert _total(score_matrix, row_ind, col_ind) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_sparse_matches_dense(seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(1, 40))
+    density = rng.uniform(0, SPARSE_DENSITY)
+    score_matrix = (rng.random((n, n)) * (rng.random((n, n)) < density)).astype(np.float32)
+    _check_against_dense(score_matrix)
+
+
+def test_sparse_all_zero():
+    score_matrix = np.zeros((5, 5), dtype=np.float32)
+    _check_against_dense(score_matrix)
+
+
+def test_sparse_no_full_matching_on_nonzero_edges():
+    # Every row only scores the first column, so at most one real edge can be used
+    score_matrix = np.zeros((6, 6), dtype=np.float32)
+    score_matrix[:, 0] = np.arange(1, 7)
+    row_ind, col_ind = _solve_sparse(score_matrix)
+    assert _total(score_matrix, row_ind, col_ind) == 6
+    _check_against_dense(score_matrix)
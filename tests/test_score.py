@@ -0,0 +1,124 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from match import score
+from match.prefs import Encoder, Prefs
+from match.utils import pad_prefs, to_csr
+
+VEC_SCORERS = [
+    (score.one_zero, score.identity),
+    (score.one_zero, score.exponential),
+    (score.frac, score.identity),
+    (score.frac, score.exponential),
+]
+
+
+def _random_prefs(rng, n_people, n_choices):
+    prefs = [rng.permutation(n_choices)[:rng.integers(0, n_choices + 1)].astype(np.int32) for _ in range(n_people)]
+    return Prefs(list(range(n_people)), pad_prefs(prefs), n_choices)
+
+
+@pytest.mark.parametrize(
+    'n_people', [1, score.SCORE_MANY_TILE - 1, score.SCORE_MANY_TILE, 2 * score.SCORE_MANY_TILE + 5],
+)
+@pytest.mark.parametrize('n_rounds', [1, 4])
+@pytest.mark.parametrize('score_fn, warp_fn', VEC_SCORERS)
+def test_score_many_matches_score_vec(n_people, n_rounds, score_fn, warp_fn):
+    rng = np.random.default_rng(n_people * 10 + n_rounds)
+    prefs = _random_prefs(rng, n_people, 12)
+    matches_over_rounds = rng.integers(0, 12, (n_rounds, n_people))
+
+    scores, totals = score.score_many(matches_over_rounds, prefs, score_fn=score_fn, warp_fn=warp_fn, b=0.5)
+    assert scores.shape == (n_rounds, n_people)
+    for r, matches in enumerate(matches_over_rounds):
+        expected, expected_total = score.score_vec(matches, prefs, score_fn=score_fn, warp_fn=warp_fn, b=0.5)
+        np.testing.assert_allclose(scores[r], expected)
+        assert totals[r] == pytest.approx(expected_total)
+
+
+@pytest.fixture(params=['numba', 'numpy'])
+def kernels(request, monkeypatch):
+    """Run once with whatever kernels are available and once with the pure NumPy fallbacks"""
+    if request.param == 'numba':
+        if score.score_numba is None:
+            pytest.skip('numba is not installed')
+    else:
+        monkeypatch.setattr(score, 'score_numba', None)
+        monkeypatch.setattr(score, '_score_kernels', None)
+    return request.param
+
+
+@pytest.mark.parametrize('seed', range(10))
+@pytest.mark.parametrize('b', [0, 0.5, 1])
+def test_score_csr_matches_score_vec(kernels, seed, b):
+    rng = np.random.default_rng(seed)
+    n_people = int(rng.integers(1, 30))
+    prefs = _random_prefs(rng, n_people, 15)
+    # Make sure there is always someone with an empty list
+    empty_row = np.full((1, prefs.matrix.shape[1]), -1, dtype=np.int32)
+    prefs = Prefs(list(range(n_people + 1)), np.vstack([prefs.matrix, empty_row]), 15)
+    matches = rng.integers(0, 15, n_people + 1)
+
+    scores, total = score.score_csr(matches, *to_csr(prefs.rows()), b=b)
+    expected, expected_total = score.score_vec(matches, prefs, score_fn=score.frac, warp_fn=score.identity, b=b)
+    np.testing.assert_allclose(scores, expected)
+    assert scores[-1] == 0
+    assert total == pytest.approx(expected_total)
+
+
+@pytest.mark.parametrize('seed', range(10))
+@pytest.mark.parametrize('score_fn, warp_fn', VEC_SCORERS)
+def test_score_matches_matches_score_assignment(kernels, seed, score_fn, warp_fn):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(1, 20))
+    women = [f'w{i}' for i in range(n)]
+    men = [f'm{i}' for i in range(n)]
+    w_prefs = {w: [men[j] for j in rng.permutation(n)[:rng.integers(0, n + 1)]] for w in women}
+    matches = dict(zip(women, (men[j] for j in rng.permutation(n))))
+    men_enc = Encoder(men)
+    prefs = Prefs.from_dict(w_prefs, men_enc, Encoder(women))
+
+    expected, expected_total = score.score_assignment(matches, w_prefs, score_fn=score_fn, warp_fn=warp_fn, b=1)
+    scores, total = score.score_matches(matches, prefs, men_enc, score_fn=score_fn, warp_fn=warp_fn, b=1)
+    assert scores.keys() == expected.keys()
+    assert scores == pytest.approx(expected)
+    assert total == pytest.approx(expected_total)
+
+    scores_arr, _ = score.score_matches(matches, prefs, men_enc, score_fn=score_fn, warp_fn=warp_fn, b=1, as_dict=False)
+    np.testing.assert_allclose(scores_arr, [expected[w] for w in prefs.ids])
+
+
+def _check_aot_dispatch(score_frac_boost, monkeypatch):
+    rng = np.random.default_rng(0)
+    prefs = _random_prefs(rng, 25, 10)
+    matches = rng.integers(0, 10, 25)
+    expected, expected_total = score.score_numba._score_frac_boost(matches, prefs.matrix, 0.5)
+
+    monkeypatch.setattr(score, '_score_kernels', SimpleNamespace(score_frac_boost=score_frac_boost))
+    scores, total = score.score_vec(matches.astype(np.int32), prefs, score_fn=score.frac, warp_fn=score.identity, b=0.5)
+    np.testing.assert_allclose(scores, expected)
+    assert total == pytest.approx(expected_total)
+
+
+def test_score_vec_uses_aot_kernels(monkeypatch):
+    if score.score_numba is None:
+        pytest.skip('numba is not installed')
+    calls = []
+
+    def score_frac_boost(matches, prefs, b):
+        # The AOT signature is f8[:](i8[:], i4[:, :], f8)
+        assert matches.dtype == np.int64 and prefs.dtype == np.int32 and isinstance(b, float)
+        calls.append(b)
+        return score.score_numba._score_frac_boost(matches, prefs, b)[0]
+
+    _check_aot_dispatch(score_frac_boost, monkeypatch)
+    assert calls == [0.5]
+
+
+def test_built_aot_kernels_match_jit(monkeypatch):
+    if score.score_numba is None:
+        pytest.skip('numba is not installed')
+    score_kernels = pytest.importorskip('match._score_kernels')
+    _check_aot_dispatch(score_kernels.score_frac_boost, monkeypatch)
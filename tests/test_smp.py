@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from match import smp
+from match.utils import complete_ids, encode_prefs
+
+
+def _random_problem(seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(1, 30))
+    w_prefs = np.array([rng.permutation(n) for _ in range(n)], dtype=np.int32).reshape(n, n)
+    m_prefs = np.array([rng.permutation(n) for _ in range(n)], dtype=np.int32).reshape(n, n)
+    m_rank = np.empty((n, n), dtype=np.int32)
+    m_rank[np.arange(n)[:, None], m_prefs] = np.arange(n, dtype=np.int32)
+    return w_prefs, m_prefs, m_rank, rng.permutation(n)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_numba_matches_python(seed):
+    smp_numba = pytest.importorskip('match.smp_numba')
+    w_prefs, _, m_rank, perm = _random_problem(seed)
+    expected = smp._solve_smp(w_prefs, m_rank, perm)
+    np.testing.assert_array_equal(smp_numba._solve_smp(w_prefs, m_rank, perm), expected)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_solve_ids_is_stable(seed):
+    w_prefs, m_prefs, m_rank, _ = _random_problem(seed)
+    n = len(w_prefs)
+    w_of = smp.solve_ids(w_prefs, m_prefs, rng=np.random.default_rng(seed))
+    assert sorted(w_of.tolist()) == list(range(n))
+
+    m_of = np.empty(n, dtype=np.int64)
+    m_of[w_of] = np.arange(n)
+    w_rank = np.empty((n, n), dtype=np.int32)
+    w_rank[np.arange(n)[:, None], w_prefs] = np.arange(n, dtype=np.int32)
+    # No woman and man both prefer each other to who they are matched with
+    for w in range(n):
+        for m in w_prefs[w, :w_rank[w, m_of[w]]]:
+            assert m_rank[m, w] > m_rank[m, w_of[m]]
+
+
+def test_completion_ignores_repeated_names():
+    m_id = {'m1': 0, 'm2': 1, 'm3': 2}
+    prefs = encode_prefs({'w1': ['m1', 'm1']}, ['w1'], m_id)
+    completed = complete_ids(prefs, 3, np.random.default_rng(0))
+    assert completed[0, 0] == 0
+    assert sorted(completed[0].tolist()) == [0, 1, 2]
+
+
+def test_unknown_name_is_rejected():
+    with pytest.raises(Exception, match='incomplete list of prefs'):
+        smp.validate_partial_prefs({'w1': ['m1', 'mX']}, {'m1', 'm2'})